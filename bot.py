@@ -1,10 +1,13 @@
 from __future__ import annotations
+import html
 import io
 import logging
 import os
 import random
+import re
 from dataclasses import dataclass
 from datetime import datetime, time, timedelta
+from functools import lru_cache
 from pathlib import Path
 from typing import List, Sequence
 from zoneinfo import ZoneInfo
@@ -12,7 +15,7 @@ from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
 import asyncio
 from PIL import Image
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Message, Update
 from telegram.error import BadRequest, TimedOut, NetworkError
 from telegram.ext import (
     AIORateLimiter,
@@ -21,12 +24,19 @@ from telegram.ext import (
     CallbackQueryHandler,
     CommandHandler,
     ContextTypes,
+    Job,
     MessageHandler,
     filters,
 )
 from telegram.request import HTTPXRequest
 
-from storage import ConfirmationStorage, SubscribersStorage, ReminderMessagesStorage, UserSettingsStorage
+from storage import (
+    ConfirmationStorage,
+    ReminderMessagesStorage,
+    SubscribersStorage,
+    UsedImagesStorage,
+    UserSettingsStorage,
+)
 
 BASE_DIR = Path(__file__).resolve().parent
 
@@ -46,24 +56,42 @@ class ReminderConfig:
     token: str
     timezone: ZoneInfo
     reminder_times: Sequence[time]
+    # Те же времена строками "HH:MM" - так они хранятся в слотах
+    reminder_slots: tuple[str, ...]
     data_file: Path
+    escalation_target: str
+    proxy: str | None
+    connection_pool_size: int
+    pool_timeout: float
 
     @property
     def tz_aware_now(self) -> datetime:
         return datetime.now(self.timezone)
 
 
+# Допускаем пробелы вокруг частей и одну цифру в часах/минутах: "9:5" - это 09:05
+_TIME_RE = re.compile(r"^\s*(\d+)\s*:\s*(\d+)\s*$")
+
+
 def parse_times(raw: str) -> List[time]:
     values = []
+    seen = set()
     for chunk in raw.split(","):
-        chunk = chunk.strip()
-        if not chunk:
+        if not chunk.strip():
             continue
+        error = f"Неверный формат времени '{chunk.strip()}'. Используйте HH:MM."
+        match = _TIME_RE.match(chunk)
+        if match is None:
+            raise ValueError(error)
         try:
-            hours, minutes = map(int, chunk.split(":"))
-            values.append(time(hour=hours, minute=minutes))
+            value = time(hour=int(match.group(1)), minute=int(match.group(2)))
         except ValueError as exc:
-            raise ValueError(f"Неверный формат времени '{chunk}'. Используйте HH:MM.") from exc
+            raise ValueError(error) from exc
+        # Повторы вроде "09:00,09:00" молча схлопываем
+        if value in seen:
+            continue
+        seen.add(value)
+        values.append(value)
     if len(values) == 0:
         raise ValueError("Нужно указать хотя бы одно время напоминания.")
     return values
@@ -81,15 +109,30 @@ def load_config() -> ReminderConfig:
         raise RuntimeError(f"Неизвестный часовой пояс '{tz_name}'.") from exc
 
     times_raw = os.environ.get("REMINDER_TIMES", "09:00,15:00,21:00")
-    reminder_times = parse_times(times_raw)
+    reminder_times = tuple(sorted(parse_times(times_raw)))
 
     data_file = Path(os.environ.get("DATA_FILE", "data/confirmations.json"))
+    escalation_target = os.environ.get("ESCALATION_TARGET", "@stapg")
+    proxy = (os.environ.get("TELEGRAM_PROXY") or "").strip() or None
+
+    try:
+        connection_pool_size = int(os.environ.get("HTTP_POOL_SIZE", "32"))
+        pool_timeout = float(os.environ.get("HTTP_POOL_TIMEOUT", "10"))
+    except ValueError as exc:
+        raise RuntimeError("HTTP_POOL_SIZE и HTTP_POOL_TIMEOUT должны быть числами.") from exc
+    if connection_pool_size < 1:
+        raise RuntimeError("HTTP_POOL_SIZE должен быть не меньше 1.")
 
     return ReminderConfig(
         token=token,
         timezone=timezone,
-        reminder_times=tuple(sorted(reminder_times)),
+        reminder_times=reminder_times,
+        reminder_slots=tuple(t.strftime("%H:%M") for t in reminder_times),
         data_file=data_file,
+        escalation_target=escalation_target,
+        proxy=proxy,
+        connection_pool_size=connection_pool_size,
+        pool_timeout=pool_timeout,
     )
 
 
@@ -98,25 +141,143 @@ STORAGE = ConfirmationStorage(CONFIG.data_file)
 SUBSCRIBERS = SubscribersStorage(CONFIG.data_file.parent / "subscribers.json")
 REMINDER_MESSAGES = ReminderMessagesStorage()
 USER_SETTINGS = UserSettingsStorage(CONFIG.data_file.parent / "user_settings.json")
-ESCALATION_TARGET = os.environ.get("ESCALATION_TARGET", "@stapg")
+USED_IMAGES = UsedImagesStorage(CONFIG.data_file.parent / "used_images.json")
 
 # Папка с картинками для напоминаний
 IMAGES_DIR = BASE_DIR / "images"
 IMAGES_DIR.mkdir(exist_ok=True)
+IMAGE_EXTENSIONS = frozenset({".jpg", ".jpeg", ".png", ".gif"})
+
+
+def _list_images(directory: Path) -> List[Path]:
+    """Один проход scandir по папке вместо отдельного glob на каждое расширение."""
+    try:
+        with os.scandir(directory) as it:
+            return [
+                Path(entry.path)
+                for entry in it
+                if entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS
+            ]
+    except FileNotFoundError:
+        return []
+
+
+class ImageIndex:
+    """Кэш списка картинок; пересобирается только при изменении mtime папки."""
+
+    def __init__(self, directory: Path) -> None:
+        self._directory = directory
+        self._entries: List[Path] = []
+        self._names: frozenset[str] = frozenset()
+        self._dir_mtime: float | None = None
+
+    def _refresh(self) -> None:
+        try:
+            mtime = self._directory.stat().st_mtime
+        except FileNotFoundError:
+            self._entries, self._names, self._dir_mtime = [], frozenset(), None
+            return
+        if mtime == self._dir_mtime:
+            return
+        entries = _list_images(self._directory)
+        self._entries = entries
+        self._names = frozenset(path.name for path in entries)
+        self._dir_mtime = mtime
+
+    def all(self) -> List[Path]:
+        """Возвращает список картинок (закэшированный)."""
+        self._refresh()
+        return self._entries
+
+    @property
+    def names(self) -> frozenset[str]:
+        """Возвращает имена файлов картинок."""
+        self._refresh()
+        return self._names
+
+
+IMAGE_INDEX = ImageIndex(IMAGES_DIR)
+
+# file_id уже загруженных в Telegram картинок: {(имя файла, mtime_ns): file_id}.
+# mtime в ключе: картинку, заменённую под тем же именем, загружаем заново
+PHOTO_FILE_IDS: dict[tuple[str, int], str] = {}
+# Фрагменты текста BadRequest, означающие, что Telegram не принял сам file_id
+FILE_ID_ERROR_MARKERS = ("file identifier", "file_id", "file reference")
+
+# Админы бота (могут использовать тестовые команды), в нижнем регистре
+ADMIN_USERNAMES: frozenset[str] = frozenset({"stapg"})
+
+# Сколько отправок рассылки идут параллельно (лимит Telegram ~30 сообщений/с,
+# общий темп дополнительно держит AIORateLimiter). Больше, чем соединений
+# в пуле, смысла нет: лишние задачи только ждали бы pool_timeout, а пара
+# соединений остаётся обработчикам команд.
+BROADCAST_CONCURRENCY = max(1, min(28, CONFIG.connection_pool_size - 2))
+BROADCAST_SEMAPHORE = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+
+# Запланированные повторные напоминания: {(chat_id, day_key, slot): [job, ...]}
+NAG_JOBS: dict[tuple[int, str, str], List[Job]] = {}
+
+
+# Тексты напоминаний собираются один раз при импорте, а не на каждый вызов
+MORNING_TEXTS: tuple[str, ...] = (
+    "💕 Доброе утро, Лизочка!\n\nНе забудь принять таблеточку Анаприлина, солнышко. Это важно для твоего здоровья! 💊",
+    "☀️ Привет, моя хорошая!\n\nВремя выпить утреннюю таблетку Анаприлина. Я забочусь о тебе! 💊💕",
+)
+AFTERNOON_TEXTS: tuple[str, ...] = (
+    "🌸 Лизонька, привет!\n\nПора принять дневную таблетку Анаприлина. Не забудь, пожалуйста! 💊",
+    "💐 Как дела, солнышко?\n\nНапоминаю про дневную таблеточку Анаприлина. Береги себя! 💊💕",
+)
+EVENING_TEXTS: tuple[str, ...] = (
+    "🌙 Добрый вечер, Лизочка!\n\nПора принять вечернюю таблетку Анаприлина. Я рядом! 💊",
+    "✨ Милая, не забудь вечернюю таблеточку Анаприлина. Это важно! 💊💕",
+)
+
+# Милые варианты повторных напоминаний, заранее подставленные для каждого периода
+_NAG_TEMPLATES = (
+    "💕 Лизочка, ты ещё не ответила!\n\nВыпила таблеточку {period}? Дай мне знать, пожалуйста! 💊",
+    "🥰 Солнышко, напоминаю!\n\nНе забудь подтвердить, что выпила таблетку {period}. Я волнуюсь! 💊",
+    "💝 Лизонька, отзовись!\n\nТы приняла таблетку {period}? Очень важно! 💊",
+    "🌸 Моя хорошая, не забудь ответить!\n\nВыпила Анаприлин {period}? Это для твоего здоровья! 💊",
+)
+NAG_TEXTS: dict[str, tuple[str, ...]] = {
+    period: tuple(template.format(period=period) for template in _NAG_TEMPLATES)
+    for period in ("утром", "днем", "вечером", "сегодня")
+}
+
+CONFIRM_TEXTS: tuple[str, ...] = (
+    "✅ Отлично, Лизочка! Молодец, что выпила таблетку! 💕\n\nЯ горжусь тобой! 🥰",
+    "✅ Супер, солнышко! Таблетка принята! 💊\n\nТы умничка! 💕",
+    "✅ Ура! Спасибо, что позаботилась о своём здоровье! 💕\n\nЛюблю тебя, Лизочка! 🥰",
+    "✅ Прекрасно, моя хорошая! Таблетка принята! 💊\n\nТы — самая лучшая! 💕",
+)
 
-# Админы бота (могут использовать тестовые команды)
-ADMIN_USERNAMES = {"stapg"}
+STATUS_EMOJI: dict[str, str] = {"pending": "⏳", "confirmed": "✅", "skipped": "⚠️"}
+STATUS_TEXT: dict[str, str] = {"pending": "жду ответа", "confirmed": "принято", "skipped": "пропущено"}
+
+WEEKDAYS_RU: tuple[str, ...] = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс")
+# Эмодзи дня по числу принятых таблеток: ⚫ 0, 🔴 1, 🟡 2, 🟢 3+
+EMOJI_BY_COUNT: tuple[str, ...] = ("⚫", "🔴", "🟡", "🟢")
 
 
 def make_day_key(chat_id: int, date_key: str) -> str:
     return f"{chat_id}:{date_key}"
 
 
-def get_default_slots() -> List[str]:
-    return [t.strftime("%H:%M") for t in CONFIG.reminder_times]
+def format_date_key(value: datetime) -> str:
+    """Возвращает дату в виде YYYY-MM-DD (без strftime — он заметно медленнее)."""
+    return f"{value.year:04d}-{value.month:02d}-{value.day:02d}"
+
+
+def format_short_date(value: datetime) -> str:
+    """Возвращает дату в виде ДД.ММ."""
+    return f"{value.day:02d}.{value.month:02d}"
+
+
+def get_default_slots() -> Sequence[str]:
+    return CONFIG.reminder_slots
 
 
-def get_user_slots(chat_id: int) -> List[str]:
+def get_user_slots(chat_id: int) -> Sequence[str]:
     return USER_SETTINGS.get_times(chat_id) or get_default_slots()
 
 
@@ -129,11 +290,10 @@ def build_back_to_menu_keyboard() -> InlineKeyboardMarkup:
 def is_admin(update: Update) -> bool:
     """Проверяет, является ли пользователь админом."""
     user = update.effective_user
-    if user is None:
+    if user is None or not user.username:
         return False
     # Сравниваем без учёта регистра
-    username = (user.username or "").lower()
-    return username in ADMIN_USERNAMES
+    return user.username.lower() in ADMIN_USERNAMES
 
 
 async def send_with_retry(bot, chat_id: int, text: str, max_retries: int = 5, **kwargs):
@@ -152,6 +312,15 @@ async def send_with_retry(bot, chat_id: int, text: str, max_retries: int = 5, **
     return None
 
 
+async def gather_limited(coroutines) -> list:
+    """Выполняет корутины параллельно, не больше BROADCAST_CONCURRENCY одновременно."""
+    async def _run(coro):
+        async with BROADCAST_SEMAPHORE:
+            return await coro
+
+    return await asyncio.gather(*(_run(coro) for coro in coroutines), return_exceptions=True)
+
+
 def compress_image(photo_path: Path, max_size: int = 1280, quality: int = 85) -> io.BytesIO:
     """Сжимает изображение до указанного размера и качества, возвращает байты."""
     with Image.open(photo_path) as img:
@@ -172,23 +341,51 @@ def compress_image(photo_path: Path, max_size: int = 1280, quality: int = 85) ->
         return buffer
 
 
-async def send_photo_with_retry(bot, chat_id: int, photo_path: Path, caption: str, max_retries: int = 5, **kwargs):
-    """Отправляет сжатое фото с подписью с повторными попытками при таймаутах."""
-    # Сжимаем картинку один раз перед отправкой
+def _compress_or_none(photo_path: Path) -> io.BytesIO | None:
+    """Сжимает картинку; при ошибке возвращает None, чтобы отправить оригинал."""
     try:
-        compressed = compress_image(photo_path)
+        return compress_image(photo_path)
     except Exception as e:
         logger.warning(f"Не удалось сжать изображение {photo_path}: {e}, отправляю оригинал")
-        compressed = None
-    
+        return None
+
+
+async def send_photo_with_retry(bot, chat_id: int, photo_path: Path, caption: str, max_retries: int = 5, **kwargs):
+    """Отправляет сжатое фото с подписью с повторными попытками при таймаутах.
+
+    Уже загруженную картинку отправляет по file_id из PHOTO_FILE_IDS, не загружая заново.
+    """
+    cache_key = (photo_path.name, photo_path.stat().st_mtime_ns)
+    file_id = PHOTO_FILE_IDS.get(cache_key)
+    compressed = None if file_id else _compress_or_none(photo_path)
+
     for attempt in range(max_retries):
         try:
+            if file_id:
+                try:
+                    return await bot.send_photo(chat_id=chat_id, photo=file_id, caption=caption, **kwargs)
+                except BadRequest as e:
+                    # Ошибки чата ("Chat not found" и т.п.) к file_id отношения не имеют
+                    if not any(marker in e.message.lower() for marker in FILE_ID_ERROR_MARKERS):
+                        raise
+                    # file_id протух или недоступен - загружаем файл заново
+                    logger.warning(f"file_id для {photo_path.name} не принят: {e}, загружаю файл")
+                    PHOTO_FILE_IDS.pop(cache_key, None)
+                    file_id = None
+                    compressed = _compress_or_none(photo_path)
+
             if compressed:
                 compressed.seek(0)  # Сбрасываем позицию для повторной отправки
-                return await bot.send_photo(chat_id=chat_id, photo=compressed, caption=caption, **kwargs)
+                message = await bot.send_photo(chat_id=chat_id, photo=compressed, caption=caption, **kwargs)
             else:
                 with open(photo_path, "rb") as photo_file:
-                    return await bot.send_photo(chat_id=chat_id, photo=photo_file, caption=caption, **kwargs)
+                    message = await bot.send_photo(chat_id=chat_id, photo=photo_file, caption=caption, **kwargs)
+            if message.photo:
+                PHOTO_FILE_IDS[cache_key] = message.photo[-1].file_id
+            return message
+        except BadRequest:
+            # BadRequest - наследник NetworkError, но повтор его не исправит
+            raise
         except (TimedOut, NetworkError) as e:
             wait_time = (attempt + 1) * 2
             logger.warning(f"Таймаут при отправке фото в {chat_id}, попытка {attempt + 1}/{max_retries}, жду {wait_time}с: {e}")
@@ -201,17 +398,11 @@ async def send_photo_with_retry(bot, chat_id: int, photo_path: Path, caption: st
 
 
 def get_random_image() -> Path | None:
-    """Возвращает случайную картинку из папки images/ или None."""
-    if not IMAGES_DIR.exists():
-        return None
-    
-    all_images = list(IMAGES_DIR.glob("*.jpg")) + list(IMAGES_DIR.glob("*.jpeg")) + \
-                 list(IMAGES_DIR.glob("*.png")) + list(IMAGES_DIR.glob("*.gif"))
-    
-    if not all_images:
+    """Возвращает следующую ещё не показанную картинку из папки images/ или None."""
+    name = USED_IMAGES.next_image(IMAGE_INDEX.names)
+    if name is None:
         return None
-    
-    return random.choice(all_images)
+    return IMAGES_DIR / name
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -297,7 +488,7 @@ async def send_status(context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> None:
         )
         return
 
-    today_key = CONFIG.tz_aware_now.strftime("%Y-%m-%d")
+    today_key = format_date_key(CONFIG.tz_aware_now)
     statuses = STORAGE.list_day(make_day_key(chat_id, today_key))
     if not statuses:
         await send_with_retry(
@@ -308,15 +499,13 @@ async def send_status(context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> None:
         )
         return
 
-    lines = ["💊 Как дела с таблеточками сегодня, Лизочка:\n"]
-    for item in statuses:
-        emoji = {"pending": "⏳", "confirmed": "✅", "skipped": "⚠️"}.get(item.status, "❔")
-        status_text = {
-            "pending": "жду ответа",
-            "confirmed": "принято",
-            "skipped": "пропущено"
-        }.get(item.status, item.status)
-        lines.append(f"{emoji} {item.slot} — {status_text}")
+    lines = [
+        "💊 Как дела с таблеточками сегодня, Лизочка:\n",
+        *(
+            f"{STATUS_EMOJI.get(item.status, '❔')} {item.slot} — {STATUS_TEXT.get(item.status, item.status)}"
+            for item in statuses
+        ),
+    ]
     await send_with_retry(
         context.bot,
         chat_id,
@@ -332,40 +521,27 @@ def build_calendar_text_and_keyboard(chat_id: int, week_offset: int = 0) -> tupl
     # Вычисляем начало недели (понедельник)
     start_of_week = now - timedelta(days=now.weekday()) - timedelta(weeks=week_offset)
     
-    lines = [f"📅 Твоя статистика, Лизочка! 💕\n"]
-    
     # Формируем диапазон дат для отображения
-    week_start_str = start_of_week.strftime("%d.%m")
+    week_start_str = format_short_date(start_of_week)
     week_end = start_of_week + timedelta(days=6)
-    week_end_str = week_end.strftime("%d.%m")
-    lines.append(f"Неделя: {week_start_str} — {week_end_str}\n")
+    week_end_str = format_short_date(week_end)
     
-    # Показываем 7 дней (неделя)
-    for day_idx in range(7):
-        date = start_of_week + timedelta(days=day_idx)
-        day_key = date.strftime("%Y-%m-%d")
-        statuses = STORAGE.list_day(make_day_key(chat_id, day_key))
-        
-        # Подсчитываем количество подтверждённых таблеток
-        confirmed_count = sum(1 for item in statuses if item.status == "confirmed")
-        
-        # Выбираем эмодзи в зависимости от количества
-        if confirmed_count == 0:
-            emoji = "⚫"  # Черный - 0 таблеток
-        elif confirmed_count == 1:
-            emoji = "🔴"  # Красный - 1 таблетка
-        elif confirmed_count == 2:
-            emoji = "🟡"  # Желтый - 2 таблетки
-        else:
-            emoji = "🟢"  # Зеленый - 3+ таблетки
-        
-        # Форматируем дату
-        date_str = date.strftime("%d.%m")
-        weekday = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"][date.weekday()]
-        
-        lines.append(f"{emoji} {date_str} ({weekday}) — {confirmed_count}/3")
+    # Показываем 7 дней (неделя); счётчики подтверждённых берём одним запросом
+    dates = [start_of_week + timedelta(days=day_idx) for day_idx in range(7)]
+    confirmed_counts = STORAGE.get_confirmed_counts(
+        [make_day_key(chat_id, format_date_key(date)) for date in dates]
+    )
     
-    lines.append("\n⚫ 0 таблеток | 🔴 1 таблетка | 🟡 2 таблетки | 🟢 3 таблетки")
+    # Эмодзи дня зависит от количества таблеток (3+ — зелёный)
+    lines = [
+        "📅 Твоя статистика, Лизочка! 💕\n",
+        f"Неделя: {week_start_str} — {week_end_str}\n",
+        *(
+            f"{EMOJI_BY_COUNT[min(count, 3)]} {format_short_date(date)} ({WEEKDAYS_RU[date.weekday()]}) — {count}/3"
+            for date, count in zip(dates, confirmed_counts)
+        ),
+        "\n⚫ 0 таблеток | 🔴 1 таблетка | 🟡 2 таблетки | 🟢 3 таблетки",
+    ]
     
     # Создаём кнопки навигации
     keyboard = [
@@ -420,7 +596,7 @@ async def send_test_reminder(context: ContextTypes.DEFAULT_TYPE, chat_id: int, i
         return
 
     now = CONFIG.tz_aware_now
-    day_key = now.strftime("%Y-%m-%d")
+    day_key = format_date_key(now)
     slot = f"ТЕСТ-{now.strftime('%H:%M')}"
     timestamp = now.isoformat()
     STORAGE.mark_sent(make_day_key(chat_id, day_key), slot, timestamp)
@@ -436,12 +612,12 @@ async def send_test_reminder(context: ContextTypes.DEFAULT_TYPE, chat_id: int, i
     if image_path:
         message = await send_photo_with_retry(
             context.bot, chat_id, image_path, text,
-            reply_markup=build_keyboard(day_key, slot, chat_id),
+            reply_markup=build_keyboard(day_key, slot),
         )
     else:
         message = await send_with_retry(
             context.bot, chat_id, text,
-            reply_markup=build_keyboard(day_key, slot, chat_id),
+            reply_markup=build_keyboard(day_key, slot),
         )
 
     if message:
@@ -602,6 +778,14 @@ async def handle_reschedule_text(update: Update, context: ContextTypes.DEFAULT_T
     return True
 
 
+# Период дня по часу: 5–13 утро, 14–19 день, остальное вечер
+_HOUR_PERIOD: tuple[str, ...] = tuple(
+    "утром" if 5 <= hour < 14 else "днем" if 14 <= hour < 20 else "вечером"
+    for hour in range(24)
+)
+
+
+@lru_cache(maxsize=256)
 def get_period_name(slot_time: str) -> str:
     """Определяет название периода дня по времени."""
     # Извлекаем время из слота (может быть "ТЕСТ-23:00" или "12:00")
@@ -611,45 +795,60 @@ def get_period_name(slot_time: str) -> str:
     except (ValueError, IndexError):
         return "сегодня"
     
-    if 5 <= hour < 14:
-        return "утром"
-    elif 14 <= hour < 20:
-        return "днем"
-    else:
-        return "вечером"
+    return _HOUR_PERIOD[hour] if 0 <= hour < 24 else "вечером"
 
 
-def build_keyboard(day_key: str, slot: str, chat_id: int) -> InlineKeyboardMarkup:
+def build_keyboard(day_key: str, slot: str) -> InlineKeyboardMarkup:
+    # chat_id в кнопку не кладём: он приходит вместе с сообщением, а клавиатура
+    # получается одинаковой для всех подписчиков слота
     return InlineKeyboardMarkup(
         [
             [
                 InlineKeyboardButton(
                     "✅ Выпила",
-                    callback_data=f"confirm|{chat_id}|{day_key}|{slot}",
+                    callback_data=f"confirm|{day_key}|{slot}",
                 ),
                 InlineKeyboardButton(
                     "⚠️ Пропустить",
-                    callback_data=f"skip|{chat_id}|{day_key}|{slot}",
+                    callback_data=f"skip|{day_key}|{slot}",
                 ),
             ]
         ]
     )
 
 
-def schedule_nag_and_escalation(context: ContextTypes.DEFAULT_TYPE, chat_id: int, day_key: str, slot: str) -> None:
-    if context.job_queue is None:
-        return
-    context.job_queue.run_once(
+def schedule_nag(context: ContextTypes.DEFAULT_TYPE, chat_id: int, day_key: str, slot: str, nag_count: int) -> None:
+    """Планирует повторное напоминание и запоминает задачу в NAG_JOBS."""
+    job = context.job_queue.run_once(
         send_nag_reminder,
         when=timedelta(minutes=10),
-        name=f"nag-{chat_id}-{day_key}-{slot}-1",
+        name=f"nag-{chat_id}-{day_key}-{slot}-{nag_count}",
         data={
             "day_key": day_key,
             "slot": slot,
             "chat_id": chat_id,
-            "nag_count": 1,
+            "nag_count": nag_count,
         },
     )
+    NAG_JOBS.setdefault((chat_id, day_key, slot), []).append(job)
+
+
+def forget_nag_job(job: Job, chat_id: int, day_key: str, slot: str) -> None:
+    """Убирает сработавшую задачу из NAG_JOBS."""
+    key = (chat_id, day_key, slot)
+    jobs = NAG_JOBS.get(key)
+    if not jobs:
+        return
+    if job in jobs:
+        jobs.remove(job)
+    if not jobs:
+        NAG_JOBS.pop(key, None)
+
+
+def schedule_nag_and_escalation(context: ContextTypes.DEFAULT_TYPE, chat_id: int, day_key: str, slot: str) -> None:
+    if context.job_queue is None:
+        return
+    schedule_nag(context, chat_id, day_key, slot, nag_count=1)
     context.job_queue.run_once(
         send_escalation_reminder,
         when=timedelta(minutes=30),
@@ -664,63 +863,82 @@ def schedule_nag_and_escalation(context: ContextTypes.DEFAULT_TYPE, chat_id: int
 
 async def dispatch_reminders(context: ContextTypes.DEFAULT_TYPE) -> None:
     now = CONFIG.tz_aware_now
-    current_slot = now.strftime("%H:%M")
-    day_key = now.strftime("%Y-%m-%d")
+    current_slot = f"{now.hour:02d}:{now.minute:02d}"
+    day_key = format_date_key(now)
     timestamp = now.isoformat()
 
+    due_chat_ids = []
     for chat_id in SUBSCRIBERS.get_all():
         slots = get_user_slots(chat_id)
         if current_slot not in slots:
             continue
 
-        existing = STORAGE.list_day(make_day_key(chat_id, day_key))
-        if any(item.slot == current_slot for item in existing):
+        if STORAGE.get_slot(make_day_key(chat_id, day_key), current_slot) is not None:
             continue
 
-        await send_reminder_to_chat(context, chat_id, current_slot, day_key, timestamp)
+        due_chat_ids.append(chat_id)
 
+    if not due_chat_ids:
+        return
 
-async def send_reminder_to_chat(
+    # Одна запись в хранилище на весь слот вместо записи на каждого подписчика
+    STORAGE.mark_sent_batch(
+        (make_day_key(chat_id, day_key), current_slot, timestamp) for chat_id in due_chat_ids
+    )
+    keyboard = build_keyboard(day_key, current_slot)
+    messages = await gather_limited(
+        deliver_reminder(context, chat_id, current_slot, day_key, keyboard) for chat_id in due_chat_ids
+    )
+    REMINDER_MESSAGES.add_messages_batch(
+        (chat_id, day_key, current_slot, message.message_id)
+        for chat_id, message in zip(due_chat_ids, messages)
+        if isinstance(message, Message)
+    )
+
+
+async def deliver_reminder(
     context: ContextTypes.DEFAULT_TYPE,
     chat_id: int,
     slot: str,
     day_key: str,
-    timestamp: str,
-) -> None:
-    STORAGE.mark_sent(make_day_key(chat_id, day_key), slot, timestamp)
+    keyboard: InlineKeyboardMarkup,
+) -> Message | None:
+    """Отправляет напоминание и планирует повторы; отметки в хранилищах делает вызывающий."""
     period = get_period_name(slot)
-    morning_texts = [
-        "💕 Доброе утро, Лизочка!\n\nНе забудь принять таблеточку Анаприлина, солнышко. Это важно для твоего здоровья! 💊",
-        "☀️ Привет, моя хорошая!\n\nВремя выпить утреннюю таблетку Анаприлина. Я забочусь о тебе! 💊💕",
-    ]
-    afternoon_texts = [
-        "🌸 Лизонька, привет!\n\nПора принять дневную таблетку Анаприлина. Не забудь, пожалуйста! 💊",
-        "💐 Как дела, солнышко?\n\nНапоминаю про дневную таблеточку Анаприлина. Береги себя! 💊💕",
-    ]
-    evening_texts = [
-        "🌙 Добрый вечер, Лизочка!\n\nПора принять вечернюю таблетку Анаприлина. Я рядом! 💊",
-        "✨ Милая, не забудь вечернюю таблеточку Анаприлина. Это важно! 💊💕",
-    ]
-    text = random.choice(morning_texts if period == "утром" else afternoon_texts if period == "днем" else evening_texts)
+    text = random.choice(MORNING_TEXTS if period == "утром" else AFTERNOON_TEXTS if period == "днем" else EVENING_TEXTS)
 
     try:
         image_path = get_random_image()
         if image_path:
             message = await send_photo_with_retry(
                 context.bot, chat_id, image_path, text,
-                reply_markup=build_keyboard(day_key, slot, chat_id),
+                reply_markup=keyboard,
             )
         else:
             message = await send_with_retry(
                 context.bot, chat_id, text,
-                reply_markup=build_keyboard(day_key, slot, chat_id),
+                reply_markup=keyboard,
             )
         if message:
-            REMINDER_MESSAGES.add_message(chat_id, day_key, slot, message.message_id)
             schedule_nag_and_escalation(context, chat_id, day_key, slot)
             logger.info(f"Напоминание {slot} успешно отправлено для chat_id={chat_id}")
+        return message
     except Exception as e:
         logger.error(f"Ошибка при отправке напоминания {slot} для chat_id={chat_id}: {e}")
+        return None
+
+
+async def send_reminder_to_chat(
+    context: ContextTypes.DEFAULT_TYPE,
+    chat_id: int,
+    slot: str,
+    day_key: str,
+    timestamp: str,
+) -> None:
+    STORAGE.mark_sent(make_day_key(chat_id, day_key), slot, timestamp)
+    message = await deliver_reminder(context, chat_id, slot, day_key, build_keyboard(day_key, slot))
+    if message:
+        REMINDER_MESSAGES.add_message(chat_id, day_key, slot, message.message_id)
 
 
 async def send_reminder(context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -731,7 +949,7 @@ async def send_reminder(context: ContextTypes.DEFAULT_TYPE) -> None:
     if slot is None or chat_id is None:
         return
     now = CONFIG.tz_aware_now
-    await send_reminder_to_chat(context, chat_id, slot, now.strftime("%Y-%m-%d"), now.isoformat())
+    await send_reminder_to_chat(context, chat_id, slot, format_date_key(now), now.isoformat())
 
 
 async def send_nag_reminder(context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -741,32 +959,21 @@ async def send_nag_reminder(context: ContextTypes.DEFAULT_TYPE) -> None:
     slot = data["slot"]
     chat_id = data["chat_id"]
     nag_count = data.get("nag_count", 1)
+    forget_nag_job(context.job, chat_id, day_key, slot)
 
-    chat_day_key = make_day_key(chat_id, day_key)
-    statuses = STORAGE.list_day(chat_day_key)
-    slot_status = next((item for item in statuses if item.slot == slot), None)
+    slot_status = STORAGE.get_slot(make_day_key(chat_id, day_key), slot)
     
     # Если уже подтвердили или пропустили - ничего не делаем
     if not slot_status or slot_status.status != "pending":
         return
 
     # Отправляем напоминание
-    period = get_period_name(slot)
-    
-    # Милые варианты повторных напоминаний
-    nag_texts = [
-        f"💕 Лизочка, ты ещё не ответила!\n\nВыпила таблеточку {period}? Дай мне знать, пожалуйста! 💊",
-        f"🥰 Солнышко, напоминаю!\n\nНе забудь подтвердить, что выпила таблетку {period}. Я волнуюсь! 💊",
-        f"💝 Лизонька, отзовись!\n\nТы приняла таблетку {period}? Очень важно! 💊",
-        f"🌸 Моя хорошая, не забудь ответить!\n\nВыпила Анаприлин {period}? Это для твоего здоровья! 💊",
-    ]
-    
-    text = random.choice(nag_texts)
+    text = random.choice(NAG_TEXTS[get_period_name(slot)])
     
     try:
         message = await send_with_retry(
             context.bot, chat_id, text,
-            reply_markup=build_keyboard(day_key, slot, chat_id),
+            reply_markup=build_keyboard(day_key, slot),
         )
         
         if message:
@@ -780,30 +987,12 @@ async def send_nag_reminder(context: ContextTypes.DEFAULT_TYPE) -> None:
 
     # Планируем следующее напоминание через 10 минут, но не более 6 раз (1 час)
     if nag_count < 6:
-        context.job_queue.run_once(
-            send_nag_reminder,
-            when=timedelta(minutes=10),
-            name=f"nag-{chat_id}-{day_key}-{slot}-{nag_count + 1}",
-            data={
-                "day_key": day_key,
-                "slot": slot,
-                "chat_id": chat_id,
-                "nag_count": nag_count + 1,
-            },
-        )
+        schedule_nag(context, chat_id, day_key, slot, nag_count + 1)
 
 
 def cancel_nag_reminders(context: ContextTypes.DEFAULT_TYPE, chat_id: int, day_key: str, slot: str) -> None:
     """Отменяет все запланированные повторные напоминания для данного слота."""
-    job_queue = context.job_queue
-    if job_queue is None:
-        return
-    
-    # Ищем и удаляем все задачи, которые начинаются с nag-{chat_id}-{day_key}-{slot}
-    prefix = f"nag-{chat_id}-{day_key}-{slot}-"
-    jobs_to_remove = [job for job in job_queue.jobs() if job.name and job.name.startswith(prefix)]
-    
-    for job in jobs_to_remove:
+    for job in NAG_JOBS.pop((chat_id, day_key, slot), []):
         job.schedule_removal()
         logger.debug(f"Отменена задача напоминания: {job.name}")
 
@@ -822,10 +1011,14 @@ def cancel_all_followups_for_chat(context: ContextTypes.DEFAULT_TYPE, chat_id: i
     job_queue = context.job_queue
     if job_queue is None:
         return
-    prefixes = (f"nag-{chat_id}-", f"esc-{chat_id}-")
+    for key in [key for key in NAG_JOBS if key[0] == chat_id]:
+        for job in NAG_JOBS.pop(key):
+            job.schedule_removal()
+
+    prefix = f"esc-{chat_id}-"
     for job in job_queue.jobs():
         name = job.name or ""
-        if name.startswith(prefixes):
+        if name.startswith(prefix):
             job.schedule_removal()
 
 
@@ -835,19 +1028,26 @@ async def send_escalation_reminder(context: ContextTypes.DEFAULT_TYPE) -> None:
     slot = data["slot"]
     chat_id = data["chat_id"]
 
-    statuses = STORAGE.list_day(make_day_key(chat_id, day_key))
-    slot_status = next((item for item in statuses if item.slot == slot), None)
+    slot_status = STORAGE.get_slot(make_day_key(chat_id, day_key), slot)
     if not slot_status or slot_status.status != "pending":
         return
 
     alert_text = "Лиза не подтвердила таблетку, напомни ей!"
     try:
-        await context.bot.send_message(chat_id=ESCALATION_TARGET, text=alert_text)
-        logger.info("Эскалация отправлена для chat_id=%s slot=%s -> %s", chat_id, slot, ESCALATION_TARGET)
+        await context.bot.send_message(chat_id=CONFIG.escalation_target, text=alert_text)
+        logger.info("Эскалация отправлена для chat_id=%s slot=%s -> %s", chat_id, slot, CONFIG.escalation_target)
     except Exception as e:
         logger.warning("Не удалось отправить эскалацию: %s", e)
 
 
+async def prune_reminder_messages(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Забывает message_id напоминаний старше двух дней (на них уже не ответят)."""
+    min_day_key = format_date_key(CONFIG.tz_aware_now - timedelta(days=2))
+    removed = REMINDER_MESSAGES.prune_before(min_day_key)
+    if removed:
+        logger.info("Удалено %s устаревших слотов напоминаний из памяти", removed)
+
+
 async def delete_reminder_messages(
     context: ContextTypes.DEFAULT_TYPE,
     chat_id: int,
@@ -869,14 +1069,25 @@ async def delete_reminder_messages(
 
     message_ids_to_delete = [msg_id for msg_id in message_ids if msg_id not in keep_ids]
 
-    for msg_id in message_ids_to_delete:
+    async def _delete(msg_id: int) -> bool:
+        """Возвращает True, если сообщение можно больше не отслеживать."""
         try:
             await context.bot.delete_message(chat_id=chat_id, message_id=msg_id)
             logger.debug(f"Удалено сообщение {msg_id} для {chat_id}")
         except BadRequest as e:
+            # Сообщения уже нет или оно слишком старое - повтор не поможет
             logger.debug(f"Не удалось удалить сообщение {msg_id}: {e}")
+        except Exception as e:
+            # Таймаут/сеть: оставляем id, чтобы удалить при следующей попытке
+            logger.warning(f"Ошибка при удалении сообщения {msg_id} для {chat_id}: {e}")
+            return False
+        return True
 
-    return REMINDER_MESSAGES.remove_messages(chat_id, day_key, slot, message_ids_to_delete)
+    # Удаляем параллельно: одна задержка сети вместо задержки на каждое сообщение
+    results = await asyncio.gather(*(_delete(msg_id) for msg_id in message_ids_to_delete))
+    handled_ids = [msg_id for msg_id, handled in zip(message_ids_to_delete, results) if handled]
+
+    return REMINDER_MESSAGES.remove_messages(chat_id, day_key, slot, handled_ids)
 
 
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -958,10 +1169,13 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
         return
 
+    # Данные кнопок имеют вид "action|payload" — разбираем их один раз
+    action, _, payload = query.data.partition("|")
+
     # Обработка календаря
-    if query.data.startswith("cal_week|"):
+    if action == "cal_week":
         try:
-            week_offset = int(query.data.split("|")[1])
+            week_offset = int(payload)
             chat_id = query.message.chat_id if query.message else None
             if chat_id is None:
                 await query.answer("Ошибка получения чата.")
@@ -970,26 +1184,32 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             text, keyboard = build_calendar_text_and_keyboard(chat_id, week_offset)
             await query.edit_message_text(text, reply_markup=keyboard)
             await query.answer()
-        except (ValueError, IndexError):
+        except ValueError:
             await query.answer("Ошибка навигации.")
         return
     
     # Заглушка для неактивных кнопок
-    if query.data == "cal_noop":
+    if action == "cal_noop":
         await query.answer()
         return
     
     # Обработка подтверждений приёма таблеток
     await query.answer()
+    message_chat_id = query.message.chat_id if query.message else None
     try:
-        action, chat_id_raw, day_key, slot = query.data.split("|", 3)
-        chat_id = int(chat_id_raw)
+        fields = payload.split("|")
+        if len(fields) == 3:
+            # Кнопки старого формата: action|chat_id|day_key|slot
+            chat_id_raw, day_key, slot = fields
+            chat_id = int(chat_id_raw)
+        else:
+            day_key, slot = fields
+            chat_id = message_chat_id
     except ValueError:
         await query.edit_message_text("Некорректные данные кнопки.")
         return
 
-    message_chat_id = query.message.chat_id if query.message else None
-    if message_chat_id != chat_id:
+    if chat_id is None or message_chat_id != chat_id:
         await query.answer("Кнопка больше неактуальна.", show_alert=True)
         return
 
@@ -999,14 +1219,6 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if action == "confirm":
         STORAGE.mark_confirmed(chat_day_key, slot, CONFIG.tz_aware_now.isoformat())
         
-        # Милые варианты подтверждения
-        confirm_texts = [
-            "✅ Отлично, Лизочка! Молодец, что выпила таблетку! 💕\n\nЯ горжусь тобой! 🥰",
-            "✅ Супер, солнышко! Таблетка принята! 💊\n\nТы умничка! 💕",
-            "✅ Ура! Спасибо, что позаботилась о своём здоровье! 💕\n\nЛюблю тебя, Лизочка! 🥰",
-            "✅ Прекрасно, моя хорошая! Таблетка принята! 💊\n\nТы — самая лучшая! 💕",
-        ]
-        
         # Удаляем все повторные напоминания (nag), но сохраняем корневое сообщение с фото
         await delete_reminder_messages(
             context,
@@ -1017,7 +1229,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             keep_root_message=True,
         )
         
-        confirm_text = random.choice(confirm_texts)
+        confirm_text = random.choice(CONFIRM_TEXTS)
         
         # Редактируем текущее сообщение (сохраняем картинку, меняем подпись)
         try:
@@ -1118,20 +1330,20 @@ async def admin_test_nag(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     
     chat = update.effective_chat
     now = CONFIG.tz_aware_now
-    day_key = now.strftime("%Y-%m-%d")
+    day_key = format_date_key(now)
     slot = f"НАГ-{now.strftime('%H:%M:%S')}"
     timestamp = now.isoformat()
     period = get_period_name(slot)
     
     STORAGE.mark_sent(make_day_key(chat.id, day_key), slot, timestamp)
     
-    text = f"🔔 **Тестовое повторное напоминание**\n\n💕 Лизочка, ты ещё не ответила! Выпила таблеточку {period}?"
+    text = f"🔔 <b>Тестовое повторное напоминание</b>\n\n💕 Лизочка, ты ещё не ответила! Выпила таблеточку {period}?"
     
     message = await context.bot.send_message(
         chat_id=chat.id,
         text=text,
-        reply_markup=build_keyboard(day_key, slot, chat.id),
-        parse_mode="Markdown"
+        reply_markup=build_keyboard(day_key, slot),
+        parse_mode="HTML"
     )
     
     REMINDER_MESSAGES.add_message(chat.id, day_key, slot, message.message_id)
@@ -1145,19 +1357,18 @@ async def admin_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         return
     
     subs = SUBSCRIBERS.get_all()
-    images = list(IMAGES_DIR.glob("*.jpg")) + list(IMAGES_DIR.glob("*.jpeg")) + \
-             list(IMAGES_DIR.glob("*.png")) + list(IMAGES_DIR.glob("*.gif"))
+    images = IMAGE_INDEX.all()
     
-    times_text = ", ".join(t.strftime("%H:%M") for t in CONFIG.reminder_times)
+    times_text = ", ".join(CONFIG.reminder_slots)
     
     await update.message.reply_text(
-        f"📊 **Статус бота:**\n\n"
+        f"📊 <b>Статус бота:</b>\n\n"
         f"👥 Подписчиков: {len(subs)}\n"
         f"🖼 Картинок: {len(images)}\n"
         f"⏰ Времена напоминаний: {times_text}\n"
-        f"🌍 Часовой пояс: {CONFIG.timezone}\n"
+        f"🌍 Часовой пояс: {html.escape(str(CONFIG.timezone))}\n"
         f"📅 Сейчас: {CONFIG.tz_aware_now.strftime('%Y-%m-%d %H:%M:%S')}",
-        parse_mode="Markdown"
+        parse_mode="HTML"
     )
 
 
@@ -1172,11 +1383,9 @@ async def admin_subscribers(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text("📭 Подписчиков пока нет.")
         return
     
-    lines = ["👥 **Подписчики:**\n"]
-    for chat_id in subs:
-        lines.append(f"• `{chat_id}`")
+    lines = ["👥 <b>Подписчики:</b>\n", *(f"• <code>{chat_id}</code>" for chat_id in subs)]
     
-    await update.message.reply_text("\n".join(lines), parse_mode="Markdown")
+    await update.message.reply_text("\n".join(lines), parse_mode="HTML")
 
 
 async def admin_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -1191,14 +1400,16 @@ async def admin_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     
     text = " ".join(context.args)
     subs = SUBSCRIBERS.get_all()
+    results = await gather_limited(
+        context.bot.send_message(chat_id=chat_id, text=text) for chat_id in subs
+    )
+
     sent = 0
-    
-    for chat_id in subs:
-        try:
-            await context.bot.send_message(chat_id=chat_id, text=text)
+    for chat_id, result in zip(subs, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Не удалось отправить в {chat_id}: {result}")
+        else:
             sent += 1
-        except Exception as e:
-            logger.warning(f"Не удалось отправить в {chat_id}: {e}")
     
     await update.message.reply_text(f"✅ Отправлено {sent}/{len(subs)} подписчикам")
 
@@ -1210,20 +1421,28 @@ async def admin_clear_day(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
     
     chat = update.effective_chat
-    today_key = CONFIG.tz_aware_now.strftime("%Y-%m-%d")
+    today_key = format_date_key(CONFIG.tz_aware_now)
     chat_day_key = make_day_key(chat.id, today_key)
     
     # Просто пометим что данных нет (упрощённая очистка)
     await update.message.reply_text(
-        f"🗑 Для полной очистки удали записи с ключом `{chat_day_key}` из `data/confirmations.json`.\n\n"
+        f"🗑 Для полной очистки удали записи с ключом <code>{html.escape(chat_day_key)}</code> "
+        f"из <code>{html.escape(str(CONFIG.data_file))}</code> "
+        f"и <code>{html.escape(str(CONFIG.data_file.with_suffix('.jsonl')))}</code> (при остановленном боте).\n\n"
         f"Или используй /atest для создания новых тестовых напоминаний.",
-        parse_mode="Markdown"
+        parse_mode="HTML"
     )
 
 
+async def flush_storages(app: Application) -> None:
+    """Сбрасывает отложенные записи хранилищ на диск при остановке бота."""
+    for storage in (STORAGE, SUBSCRIBERS, USED_IMAGES):
+        storage.flush()
+
+
 def build_application() -> Application:
     # Увеличенные таймауты для российского сервера (проблемы с доступом к Telegram API)
-    proxy = (os.environ.get("TELEGRAM_PROXY") or "").strip() or None
+    proxy = CONFIG.proxy
     if proxy:
         logger.info("Telegram API через прокси (TELEGRAM_PROXY задан).")
         # Через SOCKS TLS к api.telegram.org часто дольше; 5 с даёт ложные ConnectTimeout
@@ -1231,18 +1450,20 @@ def build_application() -> Application:
     else:
         req_connect, gu_connect = 10.0, 5.0
 
+    # Исходящие запросы: рассылки идут параллельно, поэтому пул побольше
     request = HTTPXRequest(
-        connection_pool_size=8,
+        connection_pool_size=CONFIG.connection_pool_size,
         connect_timeout=req_connect,
         read_timeout=15.0,
         write_timeout=15.0,
-        pool_timeout=5.0,
+        pool_timeout=CONFIG.pool_timeout,
         proxy=proxy,
     )
 
-    # Для long polling нужен большой таймаут - это нормально
+    # Для long polling нужен большой таймаут - это нормально.
+    # getUpdates держит одно соединение, большой пул ему не нужен
     get_updates_request = HTTPXRequest(
-        connection_pool_size=8,
+        connection_pool_size=4,
         connect_timeout=gu_connect,
         read_timeout=60.0,  # Long polling ждёт до 60 сек - это ок
         write_timeout=5.0,
@@ -1256,6 +1477,7 @@ def build_application() -> Application:
         .rate_limiter(AIORateLimiter(max_retries=3))  # Автоматический retry при ошибках
         .request(request)
         .get_updates_request(get_updates_request)
+        .post_shutdown(flush_storages)
         .build()
     )
     if app.job_queue is None:
@@ -1293,13 +1515,21 @@ def build_application() -> Application:
         first=2,
         name="reminder-dispatcher",
     )
+    app.job_queue.run_repeating(
+        prune_reminder_messages,
+        interval=timedelta(hours=1),
+        first=timedelta(hours=1),
+        name="reminder-messages-prune",
+    )
     return app
 
 
 def main() -> None:
-    logger.info("Запуск бота. Базовые времена (по умолчанию): %s", ", ".join(t.strftime("%H:%M") for t in CONFIG.reminder_times))
+    logger.info("Запуск бота. Базовые времена (по умолчанию): %s", ", ".join(CONFIG.reminder_slots))
     app = build_application()
-    app.run_polling(allowed_updates=Update.ALL_TYPES)
+    # Обработчики есть только для сообщений и нажатий кнопок - остальные типы не запрашиваем.
+    # PTB прибавляет timeout к read_timeout у get_updates_request: ответ ждём до 50 + 60 с
+    app.run_polling(timeout=50, allowed_updates=[Update.MESSAGE, Update.CALLBACK_QUERY])
 
 
 if __name__ == "__main__":
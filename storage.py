@@ -1,10 +1,52 @@
 from __future__ import annotations
 
+import abc
+import atexit
 import json
+import logging
+import random
+from collections import OrderedDict, deque
 from dataclasses import dataclass
 from pathlib import Path
-from threading import Lock
-from typing import Dict, List, Optional, Set
+from threading import Lock, Timer
+from typing import AbstractSet, Deque, Dict, FrozenSet, Generic, Iterable, List, Optional, Sequence, Set, Tuple, TypeVar
+
+# Через сколько секунд после первого изменения данные пишутся на диск
+FLUSH_DELAY_SECONDS = 0.1
+
+# Через сколько секунд повторять запись, если она не удалась (диск полон и т.п.)
+FLUSH_RETRY_SECONDS = 5.0
+
+# Для редко меняющихся множеств (подписчики, показанные картинки) хватает
+# снимка раз в SNAPSHOT_INTERVAL_SECONDS и при остановке бота
+SNAPSHOT_INTERVAL_SECONDS = 30.0
+
+# После скольких строк журнала ConfirmationStorage перезаписывает снимок
+COMPACT_AFTER_EVENTS = 10_000
+
+# Сколько слотов с message_id напоминаний держать в памяти
+MAX_TRACKED_SLOTS = 10_000
+
+# Ключ слота в ReminderMessagesStorage: (chat_id, day_key, slot)
+SlotKey = Tuple[int, str, str]
+
+# Снимок ConfirmationStorage для записи: (снимок целиком или None, события, _log_size до снимка)
+_ConfirmationSnapshot = Tuple[Optional[bytes], List[Dict[str, Optional[str]]], int]
+
+logger = logging.getLogger(__name__)
+
+# Тип снимка, который _DeferredFlush передаёт из _take_snapshot в _persist
+S = TypeVar("S")
+# Тип элементов множества в _SetSnapshotStorage
+T = TypeVar("T")
+
+
+def _dump_json(data: object) -> bytes:
+    # Без indent: с отступами стандартный json уходит с C-кодировщика
+    # на заметно более медленный кодировщик на чистом Python.
+    # Без пробелов-разделителей: меньше байт на диск и в журнал.
+    # Множества (frozenset снимков) пишутся как списки.
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=list).encode("utf-8")
 
 
 @dataclass(frozen=True)
@@ -15,274 +57,534 @@ class ReminderStatus:
     confirmed_at: Optional[str]
 
 
-class ConfirmationStorage:
-    """Простейшее файловое хранилище для отметок приёма лекарства."""
+class _DeferredFlush(abc.ABC, Generic[S]):
+    """Отложенная запись на диск: серия изменений сбрасывается одной записью.
+
+    Наследник создаёт self._lock, вызывает _init_flush() и реализует
+    _take_snapshot() и _persist().
+    Запись происходит через _flush_delay секунд после первого изменения.
+    Под self._lock только забирается снимок (_take_snapshot), кодирование и
+    запись идут вне его под отдельной self._write_lock. Если запись упала,
+    снимок возвращается через _restore_snapshot и запись повторяется через
+    FLUSH_RETRY_SECONDS.
+    """
+
+    _lock: Lock
+    _flush_delay: float = FLUSH_DELAY_SECONDS
+
+    def _init_flush(self) -> None:
+        self._dirty = False
+        self._flush_timer: Optional[Timer] = None
+        # Упорядочивает записи на диск, не блокируя изменения в памяти
+        self._write_lock = Lock()
+        # Страховка на случай выхода без штатной остановки бота
+        atexit.register(self.flush)
+
+    @abc.abstractmethod
+    def _take_snapshot(self) -> S:
+        """Забирает данные для записи (вызывать под self._lock)."""
+
+    def _restore_snapshot(self, snapshot: S) -> None:
+        """Возвращает забранное _take_snapshot после неудачной записи (вызывать под self._lock)."""
+
+    @abc.abstractmethod
+    def _persist(self, snapshot: S) -> None:
+        """Записывает снимок на диск (вызывается вне self._lock)."""
+
+    def _schedule_flush(self, delay: Optional[float] = None) -> None:
+        """Помечает данные изменёнными и планирует запись (вызывать под self._lock)."""
+        self._dirty = True
+        if self._flush_timer is None:
+            # daemon: не задерживаем выход, несохранённое допишет atexit/post_shutdown
+            self._flush_timer = Timer(self._flush_delay if delay is None else delay, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush(self) -> None:
+        """Записывает накопленные изменения на диск."""
+        with self._write_lock:
+            with self._lock:
+                if self._flush_timer is not None:
+                    self._flush_timer.cancel()
+                    self._flush_timer = None
+                if not self._dirty:
+                    return
+                self._dirty = False
+                snapshot = self._take_snapshot()
+            try:
+                self._persist(snapshot)
+            except Exception:
+                logger.exception("Не удалось записать %s, повторю через %s с", type(self).__name__, FLUSH_RETRY_SECONDS)
+                with self._lock:
+                    self._restore_snapshot(snapshot)
+                    self._schedule_flush(FLUSH_RETRY_SECONDS)
+
+
+class ConfirmationStorage(_DeferredFlush[_ConfirmationSnapshot]):
+    """Простейшее файловое хранилище для отметок приёма лекарства.
+
+    Данные держатся в памяти. На диске лежит снимок (JSON) и журнал изменений
+    рядом с ним (JSONL): каждое изменение дописывается в журнал одной строкой,
+    а когда в журнале набирается COMPACT_AFTER_EVENTS строк, снимок
+    перезаписывается целиком и журнал очищается.
+    """
 
     def __init__(self, file_path: Path) -> None:
         self._file_path = file_path
         self._file_path.parent.mkdir(parents=True, exist_ok=True)
+        self._log_path = self._file_path.with_suffix(".jsonl")
         self._lock = Lock()
-        if not self._file_path.exists():
-            self._write({})
+        try:
+            self._data = self._read()
+        except FileNotFoundError:
+            self._data = {}
+            self._write(b"{}")
+        self._log_size = self._replay_log(self._data)
+        # Слоты внутри дня держим отсортированными, чтобы list_day не сортировал
+        for day_key, day in self._data.items():
+            self._data[day_key] = dict(sorted(day.items()))
+        # Изменения, ещё не дописанные в журнал
+        self._pending_events: List[Dict[str, Optional[str]]] = []
+        # Число подтверждённых слотов по day_key, поддерживается при каждой записи
+        self._confirmed_counts: Dict[str, int] = {
+            day_key: count
+            for day_key, day in self._data.items()
+            if (count := sum(1 for entry in day.values() if entry.get("status") == "confirmed"))
+        }
+        self._init_flush()
 
     def _read(self) -> Dict[str, Dict[str, Dict[str, Optional[str]]]]:
-        if not self._file_path.exists():
-            return {}
-        return json.loads(self._file_path.read_text(encoding="utf-8"))
+        return json.loads(self._file_path.read_bytes())
 
-    def _write(self, data: Dict[str, Dict[str, Dict[str, Optional[str]]]]) -> None:
+    def _write(self, payload: bytes) -> None:
         tmp = self._file_path.with_suffix(".tmp")
-        tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+        tmp.write_bytes(payload)
         tmp.replace(self._file_path)
 
+    def _replay_log(self, data: Dict[str, Dict[str, Dict[str, Optional[str]]]]) -> int:
+        """Применяет журнал к снимку, возвращает число строк в журнале."""
+        try:
+            log_file = self._log_path.open("rb")
+        except FileNotFoundError:
+            return 0
+        count = 0
+        broken = False
+        # Читаем построчно: журнал не загружается в память целиком
+        with log_file as log:
+            for line in log:
+                try:
+                    event = json.loads(line)
+                    day_key, slot = event.pop("day"), event.pop("slot")
+                    if not (isinstance(day_key, str) and isinstance(slot, str)):
+                        raise TypeError("day и slot должны быть строками")
+                    data.setdefault(day_key, {}).setdefault(slot, {}).update(event)
+                except (json.JSONDecodeError, UnicodeDecodeError, KeyError, TypeError, AttributeError):
+                    # Недописанная строка после аварийного завершения или не событие вовсе
+                    broken = True
+                    continue
+                count += 1
+        if broken:
+            # Сворачиваем журнал сразу, чтобы новые строки не приклеились к битой
+            self._write(_dump_json(data))
+            self._log_path.write_text("", encoding="utf-8")
+            return 0
+        return count
+
+    def _append_log(self, events: List[Dict[str, Optional[str]]]) -> None:
+        payload = b"".join(_dump_json(event) + b"\n" for event in events)
+        with self._log_path.open("ab") as log:
+            start = log.tell()
+            try:
+                log.write(payload)
+                log.flush()
+            except BaseException:
+                # Отрезаем недописанный хвост, чтобы повтор не приклеился к обрывку строки
+                log.truncate(start)
+                raise
+
+    def _take_snapshot(self) -> _ConfirmationSnapshot:
+        """Забирает накопленные события; при переполнении журнала ещё и снимок целиком."""
+        events, self._pending_events = self._pending_events, []
+        log_size = self._log_size
+        if log_size + len(events) > COMPACT_AFTER_EVENTS:
+            self._log_size = 0
+            # Записи слотов меняются на месте, поэтому снимок кодируется здесь;
+            # случается это раз в COMPACT_AFTER_EVENTS изменений
+            return _dump_json(self._data), events, log_size
+        self._log_size += len(events)
+        return None, events, log_size
+
+    def _restore_snapshot(self, snapshot: _ConfirmationSnapshot) -> None:
+        _, events, log_size = snapshot
+        # Забранные события идут раньше появившихся за время записи
+        self._pending_events[:0] = events
+        self._log_size = log_size
+
+    def _persist(self, snapshot: _ConfirmationSnapshot) -> None:
+        payload, events, _ = snapshot
+        if events:
+            # События после добавления в список не меняются, кодируем их вне self._lock.
+            # При сворачивании они тоже сначала идут в журнал: если упасть между записью
+            # снимка и очисткой журнала, журнал при загрузке доведёт снимок до того же
+            # состояния, а не откатит его к более старым строкам
+            self._append_log(events)
+        if payload is not None:
+            self._write(payload)
+            self._log_path.write_text("", encoding="utf-8")
+
+    def _update_entry(
+        self,
+        day_key: str,
+        slot: str,
+        entry: Dict[str, Optional[str]],
+        changes: Dict[str, Optional[str]],
+    ) -> None:
+        """Обновляет запись слота, счётчик подтверждённых и журнал (вызывать под self._lock)."""
+        delta = (changes["status"] == "confirmed") - (entry.get("status") == "confirmed")
+        entry.update(changes)
+        self._pending_events.append({"day": day_key, "slot": slot, **changes})
+        if delta:
+            count = self._confirmed_counts.get(day_key, 0) + delta
+            if count:
+                self._confirmed_counts[day_key] = count
+            else:
+                self._confirmed_counts.pop(day_key, None)
+
+    def _set_sent(self, day_key: str, slot: str, sent_at_iso: str) -> None:
+        day = self._data.setdefault(day_key, {})
+        entry = day.get(slot)
+        if entry is None:
+            last_slot = next(reversed(day), None)
+            entry = day[slot] = {}
+            if last_slot is not None and slot < last_slot:
+                # Обычно слоты дня приходят по порядку; иначе пересобираем день
+                self._data[day_key] = dict(sorted(day.items()))
+        self._update_entry(day_key, slot, entry, {"status": "pending", "sent_at": sent_at_iso, "confirmed_at": None})
+
     def mark_sent(self, day_key: str, slot: str, sent_at_iso: str) -> None:
         with self._lock:
-            data = self._read()
-            day = data.setdefault(day_key, {})
-            entry = day.setdefault(slot, {})
-            entry.update({"status": "pending", "sent_at": sent_at_iso, "confirmed_at": None})
-            self._write(data)
+            self._set_sent(day_key, slot, sent_at_iso)
+            self._schedule_flush()
+
+    def mark_sent_batch(self, entries: Iterable[Tuple[str, str, str]]) -> None:
+        """Помечает отправленными сразу несколько слотов (day_key, slot, sent_at_iso)."""
+        with self._lock:
+            for day_key, slot, sent_at_iso in entries:
+                self._set_sent(day_key, slot, sent_at_iso)
+            self._schedule_flush()
 
     def mark_confirmed(self, day_key: str, slot: str, confirmed_at_iso: str) -> bool:
         with self._lock:
-            data = self._read()
-            day = data.setdefault(day_key, {})
-            entry = day.get(slot)
+            entry = self._data.get(day_key, {}).get(slot)
             if not entry:
                 return False
-            entry.update({"status": "confirmed", "confirmed_at": confirmed_at_iso})
-            self._write(data)
+            self._update_entry(day_key, slot, entry, {"status": "confirmed", "confirmed_at": confirmed_at_iso})
+            self._schedule_flush()
         return True
 
     def mark_skipped(self, day_key: str, slot: str, skipped_at_iso: str) -> bool:
         with self._lock:
-            data = self._read()
-            day = data.setdefault(day_key, {})
-            entry = day.get(slot)
+            entry = self._data.get(day_key, {}).get(slot)
             if not entry:
                 return False
-            entry.update({"status": "skipped", "confirmed_at": skipped_at_iso})
-            self._write(data)
+            self._update_entry(day_key, slot, entry, {"status": "skipped", "confirmed_at": skipped_at_iso})
+            self._schedule_flush()
         return True
 
+    @staticmethod
+    def _to_status(slot: str, entry: Dict[str, Optional[str]]) -> ReminderStatus:
+        return ReminderStatus(
+            slot=slot,
+            status=entry.get("status", "pending"),
+            sent_at=entry.get("sent_at"),
+            confirmed_at=entry.get("confirmed_at"),
+        )
+
+    def get_slot(self, day_key: str, slot: str) -> Optional[ReminderStatus]:
+        """Возвращает статус одного слота без выборки всего дня."""
+        with self._lock:
+            entry = self._data.get(day_key, {}).get(slot)
+            if entry is None:
+                return None
+            return self._to_status(slot, entry)
+
     def list_day(self, day_key: str) -> List[ReminderStatus]:
         with self._lock:
-            data = self._read()
-            day = data.get(day_key, {})
-        return [
-            ReminderStatus(
-                slot=slot,
-                status=entry.get("status", "pending"),
-                sent_at=entry.get("sent_at"),
-                confirmed_at=entry.get("confirmed_at"),
-            )
-            for slot, entry in sorted(day.items())
-        ]
-
-
-class UsedImagesStorage:
-    """Хранилище использованных картинок (чтобы не повторялись)."""
+            day = dict(self._data.get(day_key, {}))
+        return [self._to_status(slot, entry) for slot, entry in day.items()]
+
+    def get_confirmed_counts(self, day_keys: Sequence[str]) -> List[int]:
+        """Возвращает число подтверждённых слотов для каждого day_key за один проход."""
+        with self._lock:
+            return [self._confirmed_counts.get(day_key, 0) for day_key in day_keys]
+
+
+class _SetSnapshotStorage(_DeferredFlush[FrozenSet[T]]):
+    """Множество в JSON-файле вида {_payload_key: [...]}.
+
+    В памяти лежит неизменяемый снимок self._values: читается без блокировки,
+    а при изменении подменяется целиком. На диск пишется раз в
+    SNAPSHOT_INTERVAL_SECONDS и только если множество изменилось.
+    """
+
+    _flush_delay = SNAPSHOT_INTERVAL_SECONDS
+    _payload_key: str
 
     def __init__(self, file_path: Path) -> None:
         self._file_path = file_path
         self._file_path.parent.mkdir(parents=True, exist_ok=True)
         self._lock = Lock()
-        self._used: Set[str] = self._load()
-
-    def _load(self) -> Set[str]:
-        if not self._file_path.exists():
-            return set()
+        self._values: FrozenSet[T]
+        # Последнее записанное множество: такое же повторно не пишем
+        self._saved: Optional[FrozenSet[T]] = None
+        try:
+            self._values = self._saved = self._load()
+        except FileNotFoundError:
+            self._values = frozenset()
+            self._persist(self._values)
+        self._init_flush()
+
+    def _load(self) -> FrozenSet[T]:
+        """Загружает множество из файла; FileNotFoundError, если его ещё нет."""
         try:
-            data = json.loads(self._file_path.read_text(encoding="utf-8"))
-            return set(data.get("used_images", []))
+            data = json.loads(self._file_path.read_bytes())
+            return frozenset(data.get(self._payload_key, []))
         except (json.JSONDecodeError, ValueError):
-            return set()
+            return frozenset()
 
-    def _save(self) -> None:
+    def _take_snapshot(self) -> FrozenSet[T]:
+        return self._values
+
+    def _persist(self, snapshot: FrozenSet[T]) -> None:
+        if snapshot == self._saved:
+            return
         tmp = self._file_path.with_suffix(".tmp")
-        tmp.write_text(
-            json.dumps({"used_images": list(self._used)}, ensure_ascii=False, indent=2),
-            encoding="utf-8",
-        )
+        tmp.write_bytes(_dump_json({self._payload_key: snapshot}))
         tmp.replace(self._file_path)
+        self._saved = snapshot
+
+
+class UsedImagesStorage(_SetSnapshotStorage[str]):
+    """Хранилище использованных картинок (чтобы не повторялись)."""
+
+    _payload_key = "used_images"
+
+    def __init__(self, file_path: Path) -> None:
+        # Оставшиеся картинки текущего круга в случайном порядке
+        self._queue: Deque[str] = deque()
+        super().__init__(file_path)
 
     def mark_used(self, image_name: str) -> None:
         """Помечает картинку как использованную."""
         with self._lock:
-            self._used.add(image_name)
-            self._save()
+            if image_name in self._values:
+                return
+            self._values = self._values | {image_name}
+            self._schedule_flush()
 
     def is_used(self, image_name: str) -> bool:
         """Проверяет, была ли картинка уже использована."""
-        with self._lock:
-            return image_name in self._used
+        return image_name in self._values
 
     def get_used(self) -> Set[str]:
         """Возвращает список использованных картинок."""
+        return set(self._values)
+
+    def next_image(self, all_names: AbstractSet[str]) -> Optional[str]:
+        """Возвращает следующую картинку круга, помечая её использованной.
+
+        Круг — случайная перестановка ещё не показанных картинок; когда он
+        заканчивается, список использованных сбрасывается и круг начинается заново.
+        """
         with self._lock:
-            return self._used.copy()
+            while True:
+                if not self._queue:
+                    candidates = list(all_names - self._values)
+                    if not candidates:
+                        if not all_names:
+                            return None
+                        self._values = frozenset()
+                        candidates = list(all_names)
+                    random.shuffle(candidates)
+                    self._queue = deque(candidates)
+                name = self._queue.popleft()
+                # Картинку могли удалить из папки после начала круга
+                if name in all_names:
+                    break
+            self._values = self._values | {name}
+            self._schedule_flush()
+            return name
 
     def reset(self) -> None:
         """Сбрасывает список использованных картинок."""
         with self._lock:
-            self._used.clear()
-            self._save()
+            self._values = frozenset()
+            self._queue.clear()
+            self._schedule_flush()
 
 
 class ReminderMessagesStorage:
-    """Хранилище ID сообщений напоминаний для последующего удаления."""
-
-    def __init__(self) -> None:
-        self._lock = Lock()
-        # Структура: {f"{chat_id}:{day_key}:{slot}": [message_id1, message_id2, ...]}
-        self._messages: Dict[str, List[int]] = {}
-        # Хранилище file_id картинок: {f"{chat_id}:{day_key}:{slot}": file_id}
-        self._photos: Dict[str, str] = {}
-
-    def _make_key(self, chat_id: int, day_key: str, slot: str) -> str:
-        return f"{chat_id}:{day_key}:{slot}"
+    """Хранилище ID сообщений напоминаний для последующего удаления.
+
+    Размер ограничен: при переполнении вытесняются слоты, которые дольше всех
+    не обновлялись, а старые дни периодически удаляются через prune_before().
+    Без блокировки: вызывается только из event loop бота, а методы не содержат
+    await, поэтому корутины не могут прервать друг друга посередине.
+    """
+
+    def __init__(self, max_slots: int = MAX_TRACKED_SLOTS) -> None:
+        self._max_slots = max_slots
+        # Структура: {(chat_id, day_key, slot): [message_id1, message_id2, ...]}
+        self._messages: OrderedDict[SlotKey, List[int]] = OrderedDict()
+        # Хранилище file_id картинок: {(chat_id, day_key, slot): file_id}
+        self._photos: Dict[SlotKey, str] = {}
+
+    @staticmethod
+    def _make_key(chat_id: int, day_key: str, slot: str) -> SlotKey:
+        return (chat_id, day_key, slot)
+
+    @staticmethod
+    def _day_of(key: SlotKey) -> str:
+        return key[1]
+
+    def _add(self, key: SlotKey, message_id: int) -> None:
+        """Добавляет message_id и вытесняет самые старые слоты."""
+        messages = self._messages.get(key)
+        if messages is None:
+            messages = self._messages[key] = []
+        else:
+            self._messages.move_to_end(key)
+        messages.append(message_id)
+        while len(self._messages) > self._max_slots:
+            evicted, _ = self._messages.popitem(last=False)
+            self._photos.pop(evicted, None)
 
     def add_message(self, chat_id: int, day_key: str, slot: str, message_id: int) -> None:
         """Добавляет message_id к списку сообщений для данного слота."""
-        with self._lock:
-            key = self._make_key(chat_id, day_key, slot)
-            if key not in self._messages:
-                self._messages[key] = []
-            self._messages[key].append(message_id)
+        self._add(self._make_key(chat_id, day_key, slot), message_id)
+
+    def add_messages_batch(self, entries: Iterable[Tuple[int, str, str, int]]) -> None:
+        """Добавляет несколько message_id за раз: (chat_id, day_key, slot, message_id)."""
+        for chat_id, day_key, slot, message_id in entries:
+            self._add(self._make_key(chat_id, day_key, slot), message_id)
+
+    def prune_before(self, min_day_key: str) -> int:
+        """Удаляет слоты с day_key раньше min_day_key (YYYY-MM-DD), возвращает их число."""
+        stale = [key for key in self._messages if self._day_of(key) < min_day_key]
+        for key in stale:
+            del self._messages[key]
+        stale_photos = [key for key in self._photos if self._day_of(key) < min_day_key]
+        for key in stale_photos:
+            del self._photos[key]
+        return len(stale)
 
     def set_photo(self, chat_id: int, day_key: str, slot: str, file_id: str) -> None:
         """Сохраняет file_id картинки для данного слота."""
-        with self._lock:
-            key = self._make_key(chat_id, day_key, slot)
-            self._photos[key] = file_id
+        key = self._make_key(chat_id, day_key, slot)
+        self._photos[key] = file_id
 
     def get_photo(self, chat_id: int, day_key: str, slot: str) -> Optional[str]:
         """Возвращает file_id картинки для данного слота."""
-        with self._lock:
-            key = self._make_key(chat_id, day_key, slot)
-            return self._photos.get(key)
+        key = self._make_key(chat_id, day_key, slot)
+        return self._photos.get(key)
 
     def get_messages(self, chat_id: int, day_key: str, slot: str) -> List[int]:
         """Возвращает список message_id для данного слота."""
-        with self._lock:
-            key = self._make_key(chat_id, day_key, slot)
-            return self._messages.get(key, []).copy()
+        key = self._make_key(chat_id, day_key, slot)
+        return self._messages.get(key, []).copy()
 
     def clear_messages(self, chat_id: int, day_key: str, slot: str) -> tuple[List[int], Optional[str]]:
         """Возвращает и удаляет все message_id и photo file_id для данного слота."""
-        with self._lock:
-            key = self._make_key(chat_id, day_key, slot)
-            messages = self._messages.pop(key, [])
-            photo = self._photos.pop(key, None)
-            return messages, photo
+        key = self._make_key(chat_id, day_key, slot)
+        messages = self._messages.pop(key, [])
+        photo = self._photos.pop(key, None)
+        return messages, photo
 
     def remove_messages(self, chat_id: int, day_key: str, slot: str, message_ids: List[int]) -> Optional[str]:
         """Удаляет только указанные message_id, сохраняя остальные."""
-        with self._lock:
-            key = self._make_key(chat_id, day_key, slot)
-            existing = self._messages.get(key, [])
-            if not existing:
-                return self._photos.get(key)
+        key = self._make_key(chat_id, day_key, slot)
+        existing = self._messages.get(key, [])
+        if not existing:
+            return self._photos.get(key)
 
-            to_remove = set(message_ids)
-            remaining = [msg_id for msg_id in existing if msg_id not in to_remove]
+        to_remove = set(message_ids)
+        remaining = [msg_id for msg_id in existing if msg_id not in to_remove]
 
-            if remaining:
-                self._messages[key] = remaining
-                return self._photos.get(key)
+        if remaining:
+            self._messages[key] = remaining
+            return self._photos.get(key)
 
-            self._messages.pop(key, None)
-            return self._photos.pop(key, None)
+        self._messages.pop(key, None)
+        return self._photos.pop(key, None)
 
 
 class UserSettingsStorage:
-    """Хранилище пользовательских настроек (время напоминаний)."""
+    """Хранилище пользовательских настроек (время напоминаний).
+
+    Как и ReminderMessagesStorage, используется только из event loop и обходится без блокировки.
+    """
 
     def __init__(self, file_path: Path) -> None:
         self._file_path = file_path
         self._file_path.parent.mkdir(parents=True, exist_ok=True)
-        self._lock = Lock()
         if not self._file_path.exists():
             self._write({})
 
     def _read(self) -> Dict[str, Dict[str, List[str]]]:
-        if not self._file_path.exists():
-            return {}
         try:
-            return json.loads(self._file_path.read_text(encoding="utf-8"))
-        except (json.JSONDecodeError, ValueError):
+            return json.loads(self._file_path.read_bytes())
+        except (FileNotFoundError, json.JSONDecodeError, ValueError):
             return {}
 
     def _write(self, data: Dict[str, Dict[str, List[str]]]) -> None:
         tmp = self._file_path.with_suffix(".tmp")
-        tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+        tmp.write_bytes(_dump_json(data))
         tmp.replace(self._file_path)
 
     def get_times(self, chat_id: int) -> Optional[List[str]]:
-        with self._lock:
-            data = self._read()
-            row = data.get(str(chat_id), {})
-            times = row.get("reminder_times")
-            if not times:
-                return None
-            return list(times)
+        data = self._read()
+        row = data.get(str(chat_id), {})
+        times = row.get("reminder_times")
+        if not times:
+            return None
+        return list(times)
 
     def set_times(self, chat_id: int, times: List[str]) -> None:
-        with self._lock:
-            data = self._read()
-            row = data.setdefault(str(chat_id), {})
-            row["reminder_times"] = list(times)
-            self._write(data)
+        data = self._read()
+        row = data.setdefault(str(chat_id), {})
+        times = list(times)
+        if row.get("reminder_times") == times:
+            return
+        row["reminder_times"] = times
+        self._write(data)
 
 
-class SubscribersStorage:
+class SubscribersStorage(_SetSnapshotStorage[int]):
     """Хранилище подписчиков бота."""
 
-    def __init__(self, file_path: Path) -> None:
-        self._file_path = file_path
-        self._file_path.parent.mkdir(parents=True, exist_ok=True)
-        self._lock = Lock()
-        self._subscribers: Set[int] = self._load()
-
-    def _load(self) -> Set[int]:
-        """Загружает подписчиков из файла."""
-        if not self._file_path.exists():
-            self._save(set())
-            return set()
-        try:
-            data = json.loads(self._file_path.read_text(encoding="utf-8"))
-            return set(data.get("subscribers", []))
-        except (json.JSONDecodeError, ValueError):
-            return set()
-
-    def _save(self, subscribers: Set[int]) -> None:
-        """Сохраняет подписчиков в файл."""
-        tmp = self._file_path.with_suffix(".tmp")
-        tmp.write_text(
-            json.dumps({"subscribers": list(subscribers)}, ensure_ascii=False, indent=2),
-            encoding="utf-8",
-        )
-        tmp.replace(self._file_path)
+    _payload_key = "subscribers"
 
     def add(self, chat_id: int) -> None:
         """Добавляет подписчика."""
         with self._lock:
-            self._subscribers.add(chat_id)
-            self._save(self._subscribers)
+            if chat_id in self._values:
+                return
+            self._values = self._values | {chat_id}
+            self._schedule_flush()
 
     def remove(self, chat_id: int) -> None:
         """Удаляет подписчика."""
         with self._lock:
-            self._subscribers.discard(chat_id)
-            self._save(self._subscribers)
+            if chat_id not in self._values:
+                return
+            self._values = self._values - {chat_id}
+            self._schedule_flush()
 
     def contains(self, chat_id: int) -> bool:
         """Проверяет, является ли пользователь подписчиком."""
-        with self._lock:
-            return chat_id in self._subscribers
+        return chat_id in self._values
 
     def get_all(self) -> List[int]:
         """Возвращает список всех подписчиков."""
-        with self._lock:
-            return list(self._subscribers)
+        return list(self._values)
 